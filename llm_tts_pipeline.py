@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 import os
+import re
 import sys
 import json
-import subprocess
+import shutil
+import hashlib
+import itertools
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 from openai import OpenAI
 
@@ -36,57 +40,214 @@ client = make_client()
 
 ALLOWED_EMOTIONS = ["neutral", "happy", "sad", "angry", "excited", "energetic", "gloomy"]
 
+MODEL = "gpt-4.1-mini"  # or any chat-capable model you have access to
 
-def get_reply_and_emotion(prompt: str):
+SYSTEM_PROMPT = (
+    "You are a friendly speaking assistant in a graphics demo. "
+    "Given a user prompt, produce:\n"
+    "  - text: what the assistant should say out loud\n"
+    "  - emotion: one of "
+    "['neutral','happy','sad','angry','excited','energetic','gloomy'] "
+    "describing the overall tone of the reply.\n"
+    "Keep replies 1–2 sentences. Respond ONLY as JSON."
+)
+
+# The system prompt and response schema form a byte-identical request prefix
+# across calls (the user prompt is the only message that varies), so providers
+# with automatic prompt caching can reuse it instead of re-processing it.
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "speech_with_emotion",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "emotion": {
+                    "type": "string",
+                    "enum": ALLOWED_EMOTIONS,
+                },
+                "text": {"type": "string"},
+            },
+            "required": ["emotion", "text"],
+            "additionalProperties": False,
+        },
+        "strict": True,
+    },
+}
+
+# On-disk reply cache: identical prompts reuse the stored text/emotion and the
+# synthesized wav + alignment instead of calling the LLM and TTS again.
+#   LLM_CACHE_MODE=readWrite (default) | readOnly | off
+CACHE_DIR = Path.home() / ".cache" / "jarvis"
+CACHE_MODES = ("readWrite", "readOnly", "off")
+CACHE_MODE = os.getenv("LLM_CACHE_MODE", "readWrite")
+if CACHE_MODE not in CACHE_MODES:
+    print(f"[CACHE] WARNING: unknown LLM_CACHE_MODE={CACHE_MODE!r} "
+          f"(expected one of {', '.join(CACHE_MODES)}); using 'readWrite'")
+    CACHE_MODE = "readWrite"
+CACHE_SCHEMA_VERSION = 1
+
+
+def cache_key(prompt: str) -> str:
+    payload = {
+        "model": MODEL,
+        "system": SYSTEM_PROMPT,
+        "response_format": RESPONSE_FORMAT,
+        "prompt": prompt,
+        "schema_version": CACHE_SCHEMA_VERSION,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _atomic_write_bytes(path: Path, data: bytes):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def load_cached_reply(key: str, script_path: Path, out_wav: Path, out_json: Path) -> bool:
     """
-    Ask ChatGPT for (text, emotion) as structured JSON.
+    On a cache hit, restore script.txt, the wav and the alignment JSON from the
+    cache and return True. Returns False on a miss (or when caching is off).
+    """
+    if CACHE_MODE == "off":
+        return False
+
+    meta_path = CACHE_DIR / f"{key}.json"
+    wav_path = CACHE_DIR / f"{key}.wav"
+    align_path = CACHE_DIR / f"{key}.align.json"
+    if not (meta_path.exists() and wav_path.exists() and align_path.exists()):
+        return False
+
+    # A malformed entry (bad JSON, missing "text", non-object alignment) is a miss.
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        text = meta["text"]
+        if not isinstance(text, str):
+            raise TypeError("cached text is not a string")
+        align = json.loads(align_path.read_text(encoding="utf-8"))
+        # The cached alignment points at the wav it was generated with.
+        align["audio"] = str(out_wav).replace("\\", "/")
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+
+    script_path.write_text(text, encoding="utf-8")
+    shutil.copyfile(wav_path, out_wav)
+    out_json.write_text(json.dumps(align, separators=(",", ":")))
+    return True
+
+
+def store_cached_reply(key: str, text: str, emotion: str, out_wav: Path, out_json: Path):
+    """
+    Copy a freshly generated reply into the cache. The metadata file is written
+    last so its presence implies the wav/alignment artifacts are complete.
+    """
+    if CACHE_MODE != "readWrite":
+        return
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    _atomic_write_bytes(CACHE_DIR / f"{key}.wav", out_wav.read_bytes())
+    _atomic_write_bytes(CACHE_DIR / f"{key}.align.json", out_json.read_bytes())
+    meta = {"text": text, "emotion": emotion}
+    _atomic_write_bytes(CACHE_DIR / f"{key}.json", json.dumps(meta).encode("utf-8"))
+
+
+# Sentence boundary inside the (partially) streamed reply text.
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _partial_json_string(buf: str, key: str):
+    """
+    Decode the string value of `key` from a possibly incomplete JSON object.
+    Returns (value_so_far, closed), or (None, False) if the key hasn't started.
+    """
+    m = re.search(r'"%s"\s*:\s*"' % key, buf)
+    if not m:
+        return None, False
+
+    raw = buf[m.end():]
+    i = 0
+    while i < len(raw):
+        if raw[i] == "\\":
+            i += 2
+            continue
+        if raw[i] == '"':
+            return json.loads('"' + raw[:i] + '"'), True
+        i += 1
+
+    # Unterminated: drop a trailing, half-received escape sequence (\uXXXX at most)
+    for cut in range(len(raw), max(len(raw) - 6, 0) - 1, -1):
+        try:
+            return json.loads('"' + raw[:cut] + '"'), False
+        except ValueError:
+            continue
+    return "", False
+
+
+def stream_reply_and_emotion(prompt: str):
+    """
+    Ask ChatGPT for (text, emotion) as structured JSON, streamed.
+    The schema puts `emotion` first, so it is returned as soon as it arrives,
+    together with an iterator yielding each complete sentence of `text` while
+    the model is still generating the rest.
     """
     resp = client.chat.completions.create(
-        model="gpt-4.1-mini",  # or any chat-capable model you have access to
+        model=MODEL,
         messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a friendly speaking assistant in a graphics demo. "
-                    "Given a user prompt, produce:\n"
-                    "  - text: what the assistant should say out loud\n"
-                    "  - emotion: one of "
-                    "['neutral','happy','sad','angry','excited','energetic','gloomy'] "
-                    "describing the overall tone of the reply.\n"
-                    "Keep replies 1–2 sentences. Respond ONLY as JSON."
-                ),
-            },
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
         ],
-        response_format={
-            "type": "json_schema",
-            "json_schema": {
-                "name": "speech_with_emotion",
-                "schema": {
-                    "type": "object",
-                    "properties": {
-                        "text": {"type": "string"},
-                        "emotion": {
-                            "type": "string",
-                            "enum": ALLOWED_EMOTIONS,
-                        },
-                    },
-                    "required": ["text", "emotion"],
-                    "additionalProperties": False,
-                },
-                "strict": True,
-            },
-        },
+        response_format=RESPONSE_FORMAT,
         temperature=0.7,
+        stream=True,
     )
 
-    content = resp.choices[0].message.content
-    data = json.loads(content)
-    text = data["text"].strip()
-    emotion = data["emotion"]
+    def snapshots():
+        buf = ""
+        for chunk in resp:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                buf += delta
+                yield buf
+
+    stream = snapshots()
+    buf = ""
+    emotion = None
+    for buf in stream:
+        emotion, closed = _partial_json_string(buf, "emotion")
+        if closed:
+            break
     if emotion not in ALLOWED_EMOTIONS:
         emotion = "neutral"
-    return text, emotion
+
+    def sentences():
+        # `buf` may already hold the start of `text`; resume from it.
+        text, emitted = "", 0
+        for snapshot in itertools.chain([buf], stream):
+            partial, closed = _partial_json_string(snapshot, "text")
+            if partial is None:
+                continue
+            text = partial
+            for m in _SENTENCE_END.finditer(text, emitted):
+                sentence = text[emitted:m.start()].strip()
+                emitted = m.end()
+                if sentence:
+                    yield sentence
+            if closed:
+                break
+        rest = text[emitted:].strip()
+        if rest:
+            yield rest
+
+    return emotion, sentences()
+
+
+def _warm_tts():
+    import tts_pipeline
+    tts_pipeline.get_cmu()
+    return tts_pipeline
 
 
 def main():
@@ -109,27 +270,38 @@ def main():
         print("ERROR: script.txt (prompt) is empty.")
         sys.exit(1)
 
-    print("[LLM] Sending prompt to ChatGPT...")
-    reply_text, emotion = get_reply_and_emotion(prompt)
-    print(f"[LLM] Got reply with emotion={emotion!r}")
+    key = cache_key(prompt)
+    if load_cached_reply(key, script_path, out_wav, out_json):
+        print(f"[CACHE] Hit for prompt (key={key[:12]}), reused cached reply/audio")
+        sys.exit(0)
+
+    # Run the TTS pipeline in this process instead of spawning
+    # `tts_pipeline.py` (a second interpreter that re-imports pyttsx3/nltk and
+    # re-initializes the engine). It is imported on a worker thread, together
+    # with the cmudict load, while the LLM request is in flight; cache hits
+    # never pay for it.
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        tts_ready = pool.submit(_warm_tts)
+
+        print("[LLM] Streaming reply from ChatGPT...")
+        emotion, sentences = stream_reply_and_emotion(prompt)
+        print(f"[LLM] Got emotion={emotion!r}, speaking sentences as they arrive")
+
+        tts_pipeline = tts_ready.result()
+
+    # The pyttsx3 engine itself is created here on the main thread: its drivers
+    # (SAPI5 via COM, NSSpeechSynthesizer) are bound to the creating thread.
+    # The model keeps generating the reply text meanwhile.
+    tts_pipeline.get_engine()
+    reply_text = tts_pipeline.run_stream(sentences, out_wav, out_json, emotion)
+    if not reply_text:
+        print("ERROR: ChatGPT returned an empty reply.")
+        sys.exit(1)
 
     # Overwrite script.txt with the actual spoken text
     script_path.write_text(reply_text, encoding="utf-8")
 
-    # Call your existing TTS pipeline, which expects:
-    #   tts_pipeline.py <script_txt> <out_wav> <out_json> <emotion>
-    tts_script = Path(__file__).with_name("tts_pipeline.py")
-
-    cmd = [
-        sys.executable,
-        str(tts_script),
-        str(script_path),
-        str(out_wav),
-        str(out_json),
-        emotion,
-    ]
-    print("[TTS] Running:", " ".join(cmd))
-    subprocess.run(cmd, check=True)
+    store_cached_reply(key, reply_text, emotion, out_wav, out_json)
 
 
 if __name__ == "__main__":
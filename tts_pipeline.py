@@ -1,76 +1,126 @@
+import os
 import sys
 import json
+import re
+import pickle
+import wave
 import string
+from functools import lru_cache
 from pathlib import Path
 
 
 
+import numpy as np
 import pyttsx3
 import soundfile as sf
-import nltk
-nltk.download('cmudict')
-from nltk.corpus import cmudict
 
 SHAPES = {"AA", "CH", "EE", "IH", "OH", "OU", "TH", "dd", "ff", "kk", "nn", "pp", "rr", "ss"}
 
+# Parsed cmudict is pickled here so cold starts skip nltk's plaintext parse.
+CMU_CACHE = Path.home() / ".cache" / "jarvis" / "cmudict.pkl"
+
+def _load_cmudict():
+    import nltk
+    try:
+        nltk.data.find("corpora/cmudict")
+    except LookupError:
+        nltk.download("cmudict", quiet=True)
+    from nltk.corpus import cmudict
+    return cmudict.dict()
+
 _cmu = None
 def get_cmu():
     global _cmu
     if _cmu is None:
-        _cmu = cmudict.dict()
+        try:
+            with open(CMU_CACHE, "rb") as f:
+                _cmu = pickle.load(f)
+            if not isinstance(_cmu, dict):
+                raise TypeError("cmudict cache is not a dict")
+        except Exception:
+            # missing, truncated or incompatible pickle: rebuild it from nltk
+            _cmu = _load_cmudict()
+            try:
+                CMU_CACHE.parent.mkdir(parents=True, exist_ok=True)
+                tmp = CMU_CACHE.with_name(CMU_CACHE.name + ".tmp")
+                with open(tmp, "wb") as f:
+                    pickle.dump(_cmu, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, CMU_CACHE)
+            except OSError as e:
+                print(f"[CMU] Could not write {CMU_CACHE}: {e}")
     return _cmu
 
+# ARPAbet phone (stress stripped) -> viseme shape. Single-letter fallbacks for
+# out-of-dictionary words hit the consonant entries directly.
+_ARPA_TO_SHAPE = {
+    "AA": "AA", "AE": "AA", "AH": "AA",
+    "IY": "EE", "IH": "EE", "EY": "EE", "IX": "EE",
+    "EH": "IH",
+    "OW": "OH", "AO": "OH",
+    "AW": "OU", "AY": "OU", "OY": "OU", "UH": "OU", "UW": "OU",
+
+    "P": "pp", "B": "pp", "M": "pp",
+    "F": "ff", "V": "ff",
+    "K": "kk", "G": "kk",
+    "N": "nn", "NG": "nn",
+    "D": "dd", "T": "dd",
+    "R": "rr", "ER": "rr",
+    "S": "ss", "Z": "ss", "SH": "ss", "ZH": "ss",
+    "CH": "CH", "JH": "CH",
+    "TH": "TH", "DH": "TH",
+
+    "EE": "EE", "OH": "OH", "OU": "OU",
+}
+
 def arpabet_to_shape(arpa: str) -> str:
-    a = arpa.upper()
-    def pick(*candidates):
-        for c in candidates:
-            if c in SHAPES: return c
-        return ""
-
-    if a in {"AA", "AE", "AH"}: return pick("AA")
-    if a in {"IY", "IH", "EY", "IX"}: return pick("EE", "IH")
-    if a == "EH": return pick("IH", "EE")
-    if a in {"OW", "AO"}: return pick("OH", "OU")
-    if a in {"AW", "AY", "OY", "UH", "UW"}: return pick("OU", "OH")
-
-    if a in {"P", "B", "M"}: return pick("pp")
-    if a in {"F", "V"}: return pick("ff")
-    if a in {"K", "G"}: return pick("kk")
-    if a in {"N", "NG"}: return pick("nn")
-    if a in {"D", "T"}: return pick("dd")
-    if a in {"R", "ER"}: return pick("rr")
-    if a in {"S", "Z", "SH", "ZH"}: return pick("ss")
-    if a in {"CH", "JH"}: return pick("CH")
-    if a in {"TH", "DH"}: return pick("TH")
-
-    if a in SHAPES: return a
-    return ""
+    return _ARPA_TO_SHAPE.get(arpa.upper(), "")
+
+# Everything but ASCII letters and apostrophes, including non-ASCII punctuation
+# (em dashes, curly quotes, ellipses) that LLM replies glue onto words.
+_NON_WORD = re.compile(r"[^A-Za-z']+")
+
+@lru_cache(maxsize=20000)
+def _word_phones(word: str):
+    # cmudict keys are lowercase; fall back to spelling the word out
+    prons = get_cmu().get(word.lower())
+    if not prons:
+        return tuple(word)
+    return tuple(p[:-1] if p and p[-1].isdigit() else p for p in prons[0])
 
 def text_to_arpabet(text: str):
-    cmu = get_cmu()
     phones = []
     for raw_word in text.split():
-        word = "".join(ch for ch in raw_word if ch.isalpha() or ch == "'").upper()
+        word = _NON_WORD.sub("", raw_word.replace("\u2019", "'")).upper()
         if not word: continue
-
-        if word in cmu:
-            pron = cmu[word][0]
-            for p in pron:
-                if p and p[-1].isdigit(): p = p[:-1]
-                phones.append(p)
-        else:
-            for ch in word:
-                phones.append(ch.upper())
+        phones.extend(_word_phones(word))
     return phones
 
 def phones_to_shapes(phones):
-    return [s for p in phones if (s := arpabet_to_shape(p))]
+    return [s for s in map(_ARPA_TO_SHAPE.get, phones) if s]
+
+_engine = None
+_base_rate = None
+_base_volume = None
+def get_engine():
+    """
+    Initialize pyttsx3 once per process and reuse it for every utterance.
+    The driver's default rate/volume are remembered so per-emotion tweaks
+    don't accumulate across calls.
+    """
+    global _engine, _base_rate, _base_volume
+    if _engine is None:
+        _engine = pyttsx3.init()
+        _base_rate = _engine.getProperty("rate")
+        _base_volume = _engine.getProperty("volume")
+    return _engine
 
 def synthesize_tts(text: str, wav_path: Path, emotion: str = "neutral"):
-    engine = pyttsx3.init()
+    engine = get_engine()
 
-    base_rate = engine.getProperty("rate")
-    base_volume = engine.getProperty("volume")
+    base_rate = _base_rate
+    base_volume = _base_volume
+    engine.setProperty("rate", base_rate)
+    engine.setProperty("volume", base_volume)
 
     # crude emotion mapping
     if emotion == "happy":
@@ -90,39 +140,106 @@ def synthesize_tts(text: str, wav_path: Path, emotion: str = "neutral"):
     engine.save_to_file(text, str(wav_path))
     engine.runAndWait()
 
-def main():
-    # NEW: expect 4 args
-    if len(sys.argv) != 5:
-        print("Usage: python tts_pipeline.py <script_txt> <out_wav> <out_json> <emotion>")
-        sys.exit(1)
+def _pcm16_params(wav_path: Path):
+    """
+    Header params if wav_path is 16-bit PCM RIFF WAV, else None
+    (other sample widths, or e.g. AIFF written by NSSpeechSynthesizer).
+    """
+    try:
+        with wave.open(str(wav_path), "rb") as w:
+            params = w.getparams()
+    except (wave.Error, EOFError):
+        return None
+    return params if params.sampwidth == 2 else None
 
-    script_path = Path(sys.argv[1])
-    out_wav = Path(sys.argv[2])
-    out_json = Path(sys.argv[3])
-    emotion = sys.argv[4]  # "neutral", "happy", ...
+def wav_duration(wav_path: Path) -> float:
+    """
+    Read the duration from the WAV header. Only re-encode through soundfile
+    when the driver didn't already write 16-bit PCM WAV (e.g. AIFF on macOS).
+    """
+    params = _pcm16_params(wav_path)
+    if params is not None:
+        return params.nframes / params.framerate
 
-    text = script_path.read_text(encoding="utf-8").strip()
-    if not text:
-        print("ERROR: script.txt empty")
-        sys.exit(1)
+    audio, sr = sf.read(str(wav_path))
+    sf.write(str(wav_path), audio, sr, format="WAV", subtype="PCM_16")
+    return len(audio) / sr
 
+def run(text: str, out_wav: Path, out_json: Path, emotion: str = "neutral"):
+    """
+    Synthesize `text` to out_wav and write the viseme alignment to out_json.
+    Callable in-process (llm_tts_pipeline) so the engine and cmudict stay loaded.
+    """
     print(f"[TTS] Synthesizing {out_wav} with emotion={emotion}")
     synthesize_tts(text, out_wav, emotion=emotion)
+    write_alignment(text, out_wav, out_json, emotion)
+
+def run_stream(sentences, out_wav: Path, out_json: Path, emotion: str = "neutral") -> str:
+    """
+    Like run(), but synthesizes each sentence as soon as the iterable yields it,
+    so TTS overlaps with the LLM still generating the rest of the reply.
+    The per-sentence clips are joined into out_wav. Returns the spoken text.
+    """
+    print(f"[TTS] Synthesizing {out_wav} sentence by sentence with emotion={emotion}")
+    spoken = []
+    parts = []
+    try:
+        for i, sentence in enumerate(sentences):
+            part = out_wav.with_name(f"{out_wav.stem}.part{i}{out_wav.suffix}")
+            print(f"[TTS]   {sentence!r}")
+            parts.append(part)
+            synthesize_tts(sentence, part, emotion=emotion)
+            spoken.append(sentence)
 
-    audio, sr = sf.read(str(out_wav))
-    sf.write(str(out_wav), audio, sr, format="WAV", subtype="PCM_16")
-    duration = len(audio) / sr
+        text = " ".join(spoken)
+        if not parts:
+            return text
+
+        if len(parts) == 1:
+            os.replace(parts[0], out_wav)
+        else:
+            join_wavs(parts, out_wav)
+    finally:
+        # Also runs if synthesis fails or the LLM stream breaks mid-reply.
+        for part in parts:
+            part.unlink(missing_ok=True)
+
+    write_alignment(text, out_wav, out_json, emotion)
+    return text
+
+def join_wavs(parts, out_wav: Path):
+    """
+    Concatenate the per-sentence clips into out_wav. 16-bit PCM WAV clips with
+    matching formats are joined frame by frame without decoding; anything else
+    goes through soundfile and is re-encoded as PCM_16.
+    """
+    params = [_pcm16_params(part) for part in parts]
+    if all(params) and len({p[:3] for p in params}) == 1:
+        with wave.open(str(out_wav), "wb") as out:
+            out.setparams(params[0])
+            for part in parts:
+                with wave.open(str(part), "rb") as w:
+                    out.writeframes(w.readframes(w.getnframes()))
+        return
+
+    clips = [sf.read(str(part)) for part in parts]
+    audio = np.concatenate([audio for audio, _ in clips])
+    sf.write(str(out_wav), audio, clips[0][1], format="WAV", subtype="PCM_16")
+
+def write_alignment(text: str, out_wav: Path, out_json: Path, emotion: str):
+    duration = wav_duration(out_wav)
     print(f"[AUDIO] Duration = {duration:.3f}s")
 
     phones = text_to_arpabet(text)
     shapes = phones_to_shapes(phones)
 
-    slots = []
+    # N equal-width slots spanning the clip: edges[i] .. edges[i + 1]
     N = len(shapes)
-    for i, sh in enumerate(shapes):
-        start = (i / N) * duration
-        end = ((i + 1) / N) * duration
-        slots.append({"shape": sh, "start": start, "end": end})
+    edges = np.arange(N + 1, dtype=np.float64) * (duration / N) if N else np.zeros(1)
+    slots = [
+        {"shape": sh, "start": float(a), "end": float(b)}
+        for sh, a, b in zip(shapes, edges[:-1], edges[1:])
+    ]
 
     align = {
         "audio": str(out_wav).replace("\\", "/"),
@@ -130,8 +247,26 @@ def main():
         "emotion": emotion,  # IMPORTANT: HeadViewerApp reads this
     }
 
-    out_json.write_text(json.dumps(align, indent=2))
+    out_json.write_text(json.dumps(align, separators=(",", ":")))
     print(f"[ALIGN] Wrote alignment JSON to {out_json}")
 
+def main():
+    # NEW: expect 4 args
+    if len(sys.argv) != 5:
+        print("Usage: python tts_pipeline.py <script_txt> <out_wav> <out_json> <emotion>")
+        sys.exit(1)
+
+    script_path = Path(sys.argv[1])
+    out_wav = Path(sys.argv[2])
+    out_json = Path(sys.argv[3])
+    emotion = sys.argv[4]  # "neutral", "happy", ...
+
+    text = script_path.read_text(encoding="utf-8").strip()
+    if not text:
+        print("ERROR: script.txt empty")
+        sys.exit(1)
+
+    run(text, out_wav, out_json, emotion)
+
 if __name__ == "__main__":
     main()